@@ -1,25 +1,51 @@
+import io
+
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pacsv
 import matplotlib.pyplot as plt
 import seaborn as sns
 
 # Configurar la página
 st.title("Análisis de Datos desde CSV")
 
+# Cacheamos el parseo del CSV: la clave es el contenido del fichero,
+# así no se reparsea en cada rerun (slider, selectbox...)
+# pyarrow parsea multihilo y los dtypes Arrow evitan el object dtype en strings
+@st.cache_data
+def load_csv(file_bytes: bytes) -> pd.DataFrame:
+    table = pacsv.read_csv(io.BytesIO(file_bytes))
+    # Arrow no lanza error con texto no UTF-8: infiere columnas binary.
+    # Si aparecen, releemos como latin-1 para recuperar strings de verdad
+    if any(pa.types.is_binary(f.type) for f in table.schema):
+        table = pacsv.read_csv(
+            io.BytesIO(file_bytes),
+            read_options=pacsv.ReadOptions(encoding="latin-1"),
+        )
+    return table.to_pandas(types_mapper=pd.ArrowDtype, split_blocks=True, self_destruct=True)
+
+@st.cache_data
+def year_bounds(_df: pd.DataFrame, file_id: str, year_column: str) -> tuple:
+    # _df lleva guion bajo para que la caché no hashee el frame entero en
+    # cada rerun: la clave barata es (file_id de la subida, columna)
+    return int(_df[year_column].min()), int(_df[year_column].max())
+
 # Subir archivo CSV
 uploaded_file = st.file_uploader("Sube un archivo CSV", type=["csv"])
 
 if uploaded_file is not None:
-    df = pd.read_csv(uploaded_file)
+    df = load_csv(uploaded_file.getvalue())
     st.write("Vista previa de los datos:")
     st.write(df.head())
     
     # Seleccionar columna de año si existe
     year_column = st.selectbox("Selecciona la columna de años:", df.columns)
     if pd.api.types.is_numeric_dtype(df[year_column]):
-        min_year, max_year = int(df[year_column].min()), int(df[year_column].max())
+        min_year, max_year = year_bounds(df, uploaded_file.file_id, year_column)
         year_range = st.slider("Selecciona el rango de años:", min_year, max_year, (min_year, max_year))
-        df = df[(df[year_column] >= year_range[0]) & (df[year_column] <= year_range[1])]
+        # between hace el filtro en una sola pasada (una máscara en vez de dos)
+        df = df[df[year_column].between(*year_range)]
     
     # Seleccionar columnas para análisis
     columns = st.multiselect("Selecciona las columnas a analizar:", df.columns)
@@ -1,5 +1,15 @@
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import csv as pacsv
+from streamlit.runtime.uploaded_file_manager import UploadedFile
 
 st.set_page_config(page_title="Ventas por Plataforma y Año", layout="wide")
 
@@ -12,9 +22,57 @@ st.write(
 
 uploaded_file = st.file_uploader("Sube tu archivo CSV", type=["csv"])
 
-@st.cache_data
+def _file_key(f: UploadedFile) -> str:
+    # Clave de caché barata para subidas: el file_id que Streamlit asigna a
+    # cada subida es único, así que la clave es O(1) sin hashear el contenido
+    # y sin riesgo de que dos ficheros distintos compartan clave
+    return f.file_id
+
+def _parquet_sidecar(raw: bytes) -> Path:
+    digest = hashlib.sha1(raw).hexdigest()[:16]
+    return Path(tempfile.gettempdir()) / f"app_2_{digest}.parquet"
+
+def _write_sidecar(df: pd.DataFrame, sidecar: Path) -> None:
+    # Escritura atómica: volcamos a un temporal propio del proceso y
+    # os.replace lo publica completo, así un fallo a medias (disco lleno,
+    # proceso matado) o dos sesiones concurrentes nunca dejan un parquet
+    # parcial en la ruta final. Sin sidecar seguimos funcionando
+    tmp = sidecar.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp, compression="snappy")
+        os.replace(tmp, sidecar)
+    except OSError:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+
+# cache_resource devuelve siempre el mismo DataFrame (singleton): evita el
+# pickle/unpickle de cache_data en cada hit. No mutar el frame aguas abajo.
+@st.cache_resource(hash_funcs={UploadedFile: _file_key})
 def load_data(file) -> pd.DataFrame:
-    df = pd.read_csv(file)
+    raw = file.getvalue()
+
+    # Sidecar Parquet: en sesiones nuevas sobre el mismo fichero decodificamos
+    # Parquet en vez de re-parsear y limpiar el CSV
+    sidecar = _parquet_sidecar(raw)
+    if sidecar.exists():
+        try:
+            return pq.read_table(sidecar).to_pandas(split_blocks=True)
+        except (pa.ArrowInvalid, OSError):
+            # Sidecar ilegible (corrupto, truncado): se borra y reparseamos
+            sidecar.unlink(missing_ok=True)
+
+    # pyarrow parsea el CSV multihilo (mucho más rápido que pandas en ficheros grandes)
+    table = pacsv.read_csv(io.BytesIO(raw))
+    # Arrow no lanza error con texto no UTF-8: infiere columnas binary.
+    # Si aparecen, releemos como latin-1 para recuperar strings de verdad
+    if any(pa.types.is_binary(f.type) for f in table.schema):
+        table = pacsv.read_csv(
+            io.BytesIO(raw),
+            read_options=pacsv.ReadOptions(encoding="latin-1"),
+        )
+    df = table.to_pandas(types_mapper=pd.ArrowDtype, split_blocks=True, self_destruct=True)
 
     # Normalización básica de columnas esperadas
     required_cols = {"Platform", "Year", "Global_Sales"}
@@ -22,17 +80,37 @@ def load_data(file) -> pd.DataFrame:
     if missing:
         raise ValueError(f"Faltan columnas requeridas: {', '.join(sorted(missing))}")
 
-    # Year puede venir como float (ej. 2006.0) -> lo pasamos a entero si es posible
-    df = df.copy()
+    # Year puede venir como float (ej. 2006.0) -> lo pasamos a entero si es posible.
+    # El frame recién parseado es nuestro (lo posee la caché): sin copia defensiva
     df["Year"] = pd.to_numeric(df["Year"], errors="coerce")
     df = df.dropna(subset=["Year"])
-    df["Year"] = df["Year"].astype(int)
+    # int16 basta para años (~1970-2025) y mueve 4x menos memoria que int64
+    df["Year"] = df["Year"].astype("int16")
+
+    # Global_Sales a numérico; float32 da precisión de sobra para estas magnitudes
+    df["Global_Sales"] = pd.to_numeric(df["Global_Sales"], errors="coerce").fillna(0).astype("float32")
 
-    # Global_Sales a numérico
-    df["Global_Sales"] = pd.to_numeric(df["Global_Sales"], errors="coerce").fillna(0)
+    # Platform como categórica: isin y groupby trabajan sobre códigos enteros
+    df["Platform"] = df["Platform"].astype("category")
+
+    _write_sidecar(df, sidecar)
 
     return df
 
+@st.cache_data
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    # Serializar a CSV es Python-por-fila: se cachea para no repetirlo en cada rerun
+    return df.to_csv(index=False).encode("utf-8")
+
+@st.cache_data
+def to_feather_bytes(df: pd.DataFrame) -> bytes:
+    # Arrow IPC (Feather): serialización columnar casi a velocidad de memcpy
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
 if not uploaded_file:
     st.info("⬆️ Sube un CSV para empezar.")
     st.stop()
@@ -61,15 +139,22 @@ selected_years = st.sidebar.multiselect(
     default=years  # por defecto todos
 )
 
-filtered = df[df["Platform"].isin(selected_platforms) & df["Year"].isin(selected_years)]
+filtered = df[df["Platform"].isin(set(selected_platforms)) & df["Year"].isin(set(selected_years))]
 
 st.subheader("📌 Datos filtrados")
 st.caption(f"Filas: {len(filtered):,}")
-st.dataframe(filtered, use_container_width=True, height=260)
+# La tabla sólo muestra una ventana: enviar como mucho 10k filas al navegador
+# acota la serialización Arrow por rerun
+shown = filtered.head(10_000)
+st.dataframe(shown, use_container_width=True, height=260)
+if len(filtered) > len(shown):
+    st.caption(f"Mostrando las primeras {len(shown):,} filas de {len(filtered):,}")
 
 # ---- Agregación: ventas por plataforma y año ----
 agg = (
-    filtered.groupby(["Platform", "Year"], as_index=False)["Global_Sales"]
+    # sort=False: pivot y ranking no necesitan las claves ordenadas, nos
+    # ahorramos un sort O(G log G) por groupby
+    filtered.groupby(["Platform", "Year"], as_index=False, observed=True, sort=False)["Global_Sales"]
     .sum()
     .rename(columns={"Global_Sales": "Ventas_Globales"})
 )
@@ -80,14 +165,14 @@ if agg.empty:
     st.warning("No hay datos para los filtros seleccionados.")
     st.stop()
 
-# Tabla pivot para visualizar mejor y para el gráfico
-pivot = agg.pivot_table(
-    index="Year",
-    columns="Platform",
-    values="Ventas_Globales",
-    aggfunc="sum",
-    fill_value=0
-).sort_index()
+# Tabla pivot para visualizar mejor y para el gráfico.
+# (Platform, Year) ya es único tras el groupby: pivot es un reshape directo,
+# sin la pasada extra de agregación de pivot_table
+pivot = (
+    agg.pivot(index="Year", columns="Platform", values="Ventas_Globales")
+    .fillna(0)
+    .sort_index()
+)
 
 col1, col2 = st.columns([2, 1], gap="large")
 
@@ -97,15 +182,24 @@ with col1:
 with col2:
     st.write("**Ranking (suma de ventas globales según filtros):**")
     ranking = (
-        agg.groupby("Platform", as_index=False)["Ventas_Globales"]
+        agg.groupby("Platform", as_index=False, observed=True, sort=False)["Ventas_Globales"]
         .sum()
         .sort_values("Ventas_Globales", ascending=False)
     )
     st.dataframe(ranking, use_container_width=True, height=420)
 
-st.download_button(
+dl_csv, dl_feather = st.columns(2)
+
+dl_csv.download_button(
     "⬇️ Descargar agregación (CSV)",
-    data=agg.to_csv(index=False).encode("utf-8"),
+    data=to_csv_bytes(agg),
     file_name="ventas_por_plataforma_y_ano.csv",
     mime="text/csv",
 )
+
+dl_feather.download_button(
+    "⬇️ Descargar agregación (Feather)",
+    data=to_feather_bytes(agg),
+    file_name="ventas_por_plataforma_y_ano.feather",
+    mime="application/octet-stream",
+)
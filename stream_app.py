@@ -1,7 +1,24 @@
-import io
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pyarrow import csv as pacsv
 import streamlit as st
-import altair as alt
+from streamlit.runtime.uploaded_file_manager import UploadedFile
+
+# numba es opcional: si está instalado, la máscara de filtrado se compila
+# con LLVM y corre en paralelo; si no, se usan los kernels de pyarrow
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
 
 st.set_page_config(page_title="Visualizador de ventas (Video Game Sales)", layout="wide")
 
@@ -11,24 +28,39 @@ st.write("Sube un fichero CSV como el ejemplo y filtra por **años** y **platafo
 # -------------------------
 # Helpers
 # -------------------------
-@st.cache_data
+def _file_key(f: UploadedFile) -> str:
+    # Clave de caché barata para subidas: el file_id que Streamlit asigna a
+    # cada subida es único, así que la clave es O(1) sin hashear el contenido
+    # y sin riesgo de que dos ficheros distintos compartan clave
+    return f.file_id
+
+def _read_csv_streaming(f, encoding: str) -> pa.Table:
+    # open_csv consume el fichero por lotes: el pico de RAM son los lotes en
+    # vuelo más la tabla, no el CSV entero en bytes junto al resultado
+    with pacsv.open_csv(f, read_options=pacsv.ReadOptions(encoding=encoding)) as reader:
+        return reader.read_all()
+
 def load_csv(uploaded_file) -> pd.DataFrame:
-    # Intentamos leer con separador automático (funciona bien con CSV estándar)
-    raw = uploaded_file.read()
-    # Reposiciona el puntero por si acaso
+    # Reposiciona el puntero por si el stream ya se consumió antes
+    uploaded_file.seek(0)
+
+    # pyarrow parsea el CSV multihilo; utf-8 primero, latin-1 como fallback.
+    # Hay dos maneras de detectar texto no UTF-8 con open_csv: si aparece en
+    # el primer bloque, Arrow infiere la columna como binary sin quejarse; si
+    # aparece después (el esquema ya quedó fijado como string), la conversión
+    # lanza ArrowInvalid. Cubrimos ambas
     try:
+        table = _read_csv_streaming(uploaded_file, "utf-8")
+    except pa.ArrowInvalid:
         uploaded_file.seek(0)
-    except Exception:
-        pass
+        table = _read_csv_streaming(uploaded_file, "latin-1")
+    else:
+        if any(pa.types.is_binary(f.type) for f in table.schema):
+            uploaded_file.seek(0)
+            table = _read_csv_streaming(uploaded_file, "latin-1")
 
-    # Detectar encoding de forma simple (utf-8 primero, luego latin-1)
-    for enc in ("utf-8", "latin-1"):
-        try:
-            return pd.read_csv(io.BytesIO(raw), encoding=enc)
-        except Exception:
-            continue
-    # Último intento sin encoding explícito
-    return pd.read_csv(io.BytesIO(raw))
+    # Los dtypes Arrow evitan el object dtype de NumPy en columnas de texto
+    return table.to_pandas(types_mapper=pd.ArrowDtype, split_blocks=True, self_destruct=True)
 
 def ensure_columns(df: pd.DataFrame):
     required = {"Platform", "Year", "Global_Sales"}
@@ -36,23 +68,262 @@ def ensure_columns(df: pd.DataFrame):
     return missing
 
 def clean_df(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
+    # Modifica el frame recibido in place: el llamador (clean_csv) le pasa el
+    # frame recién parseado que posee la caché, así no se duplica el pico de RAM
+    out = df
     # Year a numérico e int (con NaN drop)
     out["Year"] = pd.to_numeric(out["Year"], errors="coerce")
     out = out.dropna(subset=["Year", "Platform", "Global_Sales"])
-    out["Year"] = out["Year"].astype(int)
+    # int16 basta para años (~1970-2025) y mueve 4x menos memoria que int64
+    out["Year"] = out["Year"].astype("int16")
 
-    # Asegurar numéricos en columnas de ventas típicas
+    # Asegurar numéricos en columnas de ventas típicas; float32 da sobra de
+    # precisión para millones de unidades y la mitad de tráfico de memoria
     sales_cols = [c for c in ["NA_Sales", "EU_Sales", "JP_Sales", "Other_Sales", "Global_Sales"] if c in out.columns]
     for c in sales_cols:
-        out[c] = pd.to_numeric(out[c], errors="coerce").fillna(0.0)
+        out[c] = pd.to_numeric(out[c], errors="coerce").fillna(0.0).astype("float32")
+
+    # Platform como categórica: isin y groupby trabajan sobre códigos enteros
+    out["Platform"] = out["Platform"].astype("category")
 
     return out
 
+def _parquet_sidecar(uploaded_file) -> Path:
+    # El sidecar persiste entre reinicios del proceso, así que su clave tiene
+    # que ser el contenido: con (nombre, tamaño) otro CSV con ese mismo par
+    # serviría los datos del fichero anterior. El digest se calcula en
+    # streaming para no cargar el fichero entero en memoria
+    digest = hashlib.sha1()
+    for chunk in iter(lambda: uploaded_file.read(1 << 20), b""):
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return Path(tempfile.gettempdir()) / f"stream_app_{digest.hexdigest()[:16]}.parquet"
+
+def _write_sidecar(df: pd.DataFrame, sidecar: Path) -> None:
+    # Escritura atómica: volcamos a un temporal propio del proceso y
+    # os.replace lo publica completo, así un fallo a medias (disco lleno,
+    # proceso matado) o dos sesiones concurrentes nunca dejan un parquet
+    # parcial en la ruta final. Sin sidecar seguimos funcionando
+    tmp = sidecar.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp, compression="snappy")
+        os.replace(tmp, sidecar)
+    except OSError:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+
+# cache_resource devuelve siempre el mismo objeto (singleton): evita el
+# pickle/unpickle de cache_data en cada hit. Los frames cacheados se tratan
+# como inmutables aguas abajo.
+@st.cache_resource(hash_funcs={UploadedFile: _file_key})
+def clean_csv(uploaded_file) -> pd.DataFrame:
+    # Sidecar Parquet: si existe, no parseamos el CSV en absoluto (el sidecar
+    # se escribió ya validado y limpio); en procesos nuevos sobre el mismo
+    # fichero decodificamos Parquet (columnar, dictionary+RLE) en su lugar
+    sidecar = _parquet_sidecar(uploaded_file)
+    if sidecar.exists():
+        try:
+            return pq.read_table(sidecar).to_pandas(split_blocks=True)
+        except (pa.ArrowInvalid, OSError):
+            # Sidecar ilegible (corrupto, truncado): se borra y reparseamos
+            sidecar.unlink(missing_ok=True)
+
+    df = load_csv(uploaded_file)
+
+    missing = ensure_columns(df)
+    if missing:
+        raise ValueError(
+            f"Faltan columnas necesarias: {', '.join(sorted(missing))} "
+            f"(detectadas: {', '.join(map(str, df.columns))})"
+        )
+
+    df = clean_df(df)
+    _write_sidecar(df, sidecar)
+    return df
+
+@st.cache_resource
+def to_arrow(_df: pd.DataFrame, file_key: str) -> pa.Table:
+    # Tabla Arrow del df limpio: el filtro por año/plataforma corre con
+    # kernels vectorizados de pyarrow.compute sin pasar por Python.
+    # _df lleva guion bajo para no hashearlo; file_key identifica el fichero.
+    return pa.Table.from_pandas(_df, preserve_index=False)
+
 def top_platforms(df: pd.DataFrame, n=8):
-    s = df.groupby("Platform", as_index=False)["Global_Sales"].sum().sort_values("Global_Sales", ascending=False)
+    # sort=False: el resultado se reordena por ventas, ordenar las claves sobra
+    s = df.groupby("Platform", as_index=False, observed=True, sort=False)["Global_Sales"].sum().sort_values("Global_Sales", ascending=False)
     return s["Platform"].head(n).tolist()
 
+@st.cache_data
+def platform_meta(_df: pd.DataFrame, file_key: str):
+    # Metadatos para los controles (opciones, defaults, rango de años): el df
+    # limpio es inmutable, así que se calculan una vez por fichero
+    options = sorted(_df["Platform"].unique().tolist())
+    defaults = top_platforms(_df, n=min(8, len(options)))
+    return options, defaults, (int(_df["Year"].min()), int(_df["Year"].max()))
+
+if HAS_NUMBA:
+    @njit(parallel=True, cache=True)
+    def _mask_kernel(years, codes, y0, y1, selected):
+        # Una sola pasada SIMD/paralela sobre los años y los códigos de
+        # plataforma; selected es un bitmap indexado por código
+        out = np.empty(years.size, np.bool_)
+        for i in prange(years.size):
+            out[i] = (years[i] >= y0) and (years[i] <= y1) and selected[codes[i]]
+        return out
+
+def _filter_table(tbl: pa.Table, y0: int, y1: int, platforms: tuple) -> pa.Table:
+    if HAS_NUMBA and platforms:
+        plat = tbl["Platform"].combine_chunks()
+        selected = np.zeros(len(plat.dictionary), np.bool_)
+        wanted = set(platforms)
+        for code, name in enumerate(plat.dictionary.to_pylist()):
+            if name in wanted:
+                selected[code] = True
+        mask = _mask_kernel(
+            tbl["Year"].combine_chunks().to_numpy(),
+            plat.indices.to_numpy(),
+            y0,
+            y1,
+            selected,
+        )
+        return tbl.filter(pa.array(mask))
+
+    mask = pc.and_(pc.greater_equal(tbl["Year"], y0), pc.less_equal(tbl["Year"], y1))
+    if platforms:
+        mask = pc.and_(mask, pc.is_in(tbl["Platform"], value_set=pa.array(list(platforms))))
+    return tbl.filter(mask)
+
+@st.cache_data
+def compute_aggs(_tbl: pa.Table, file_key: str, y0: int, y1: int, platforms: tuple):
+    # La clave de caché es (file_key, y0, y1, platforms): tocar un widget que
+    # no cambia el filtro (p.ej. un checkbox) no repite filtro ni agregaciones
+    region_cols = [c for c in ["NA_Sales", "EU_Sales", "JP_Sales", "Other_Sales"] if c in _tbl.column_names]
+
+    # Proyectamos sólo las columnas que usan las agregaciones antes de filtrar:
+    # el gather del filtro y el groupby no arrastran el resto de la fila
+    needed_cols = ["Year", "Platform", "Global_Sales"] + region_cols
+    filtered_tbl = _filter_table(_tbl.select(needed_cols), y0, y1, platforms)
+
+    # Una sola pasada sobre las filas filtradas: el hash-aggregate de Arrow suma
+    # Global_Sales y las regiones a la vez; el resto se deriva de esta tabla
+    # (muchos menos grupos que filas)
+    agg_tbl = filtered_tbl.group_by(["Year", "Platform"]).aggregate(
+        [("Global_Sales", "sum")] + [(c, "sum") for c in region_cols]
+    )
+
+    by_year_platform = (
+        agg_tbl.select(["Year", "Platform", "Global_Sales_sum"])
+        .to_pandas()
+        .rename(columns={"Global_Sales_sum": "Global_Sales"})
+        .sort_values(["Year", "Platform"])
+    )
+
+    by_year_tbl = agg_tbl.group_by("Year").aggregate(
+        [("Global_Sales_sum", "sum")] + [(f"{c}_sum", "sum") for c in region_cols]
+    )
+
+    by_year = (
+        by_year_tbl.select(["Year", "Global_Sales_sum_sum"])
+        .to_pandas()
+        .rename(columns={"Global_Sales_sum_sum": "Global_Sales"})
+        .sort_values("Year")
+    )
+
+    # Suma por plataforma derivada de agg_tbl (ya agregada): sin otra pasada
+    # sobre las filas filtradas
+    per_platform = (
+        agg_tbl.group_by("Platform")
+        .aggregate([("Global_Sales_sum", "sum")])
+        .to_pandas()
+        .rename(columns={"Global_Sales_sum_sum": "Global_Sales"})
+    )
+    top_plat = per_platform.nlargest(12, "Global_Sales")
+
+    # Region breakdown (si están las columnas)
+    by_year_regions_long = None
+    if region_cols:
+        by_year_regions = (
+            by_year_tbl.select(["Year"] + [f"{c}_sum_sum" for c in region_cols])
+            .to_pandas()
+            .rename(columns={f"{c}_sum_sum": c for c in region_cols})
+            .sort_values("Year")
+        )
+        by_year_regions_long = by_year_regions.melt("Year", var_name="Región", value_name="Ventas")
+
+    return filtered_tbl.num_rows, by_year, by_year_platform, top_plat, by_year_regions_long
+
+@st.cache_data
+def filtered_df(_tbl: pa.Table, file_key: str, y0: int, y1: int, platforms: tuple, max_rows: int = 10_000) -> pd.DataFrame:
+    # Sólo se materializa en pandas cuando la tabla filtrada se va a mostrar.
+    # La UI enseña una ventana de filas: limitar a max_rows acota la
+    # serialización Arrow hacia el navegador y los bytes enviados
+    return _filter_table(_tbl, y0, y1, platforms).slice(0, max_rows).to_pandas(split_blocks=True)
+
+# -------------------------
+# Specs Vega-Lite
+# -------------------------
+# Specs escritas a mano y reutilizadas entre reruns: evitan construir y
+# validar el spec de Altair (schemapi) en cada interacción; por rerun sólo
+# cambian los datos
+
+CHART_TOTAL_SPEC = {
+    "mark": {"type": "line", "point": True},
+    "encoding": {
+        "x": {"field": "Year", "type": "ordinal", "title": "Año"},
+        "y": {"field": "Global_Sales", "type": "quantitative", "title": "Ventas (millones)"},
+        "tooltip": [
+            {"field": "Year", "type": "ordinal", "title": "Año"},
+            {"field": "Global_Sales", "type": "quantitative", "title": "Ventas", "format": ",.2f"},
+        ],
+    },
+    "height": 320,
+}
+
+CHART_TOP_PLAT_SPEC = {
+    "mark": "bar",
+    "encoding": {
+        "y": {"field": "Platform", "type": "nominal", "sort": "-x", "title": "Plataforma"},
+        "x": {"field": "Global_Sales", "type": "quantitative", "title": "Ventas (millones)"},
+        "tooltip": [
+            {"field": "Platform", "type": "nominal", "title": "Plataforma"},
+            {"field": "Global_Sales", "type": "quantitative", "title": "Ventas", "format": ",.2f"},
+        ],
+    },
+    "height": 320,
+}
+
+CHART_LINES_SPEC = {
+    "mark": "line",
+    "encoding": {
+        "x": {"field": "Year", "type": "ordinal", "title": "Año"},
+        "y": {"field": "Global_Sales", "type": "quantitative", "title": "Ventas (millones)"},
+        "color": {"field": "Platform", "type": "nominal", "title": "Plataforma"},
+        "tooltip": [
+            {"field": "Year", "type": "ordinal", "title": "Año"},
+            {"field": "Platform", "type": "nominal", "title": "Plataforma"},
+            {"field": "Global_Sales", "type": "quantitative", "title": "Ventas", "format": ",.2f"},
+        ],
+    },
+    "height": 380,
+}
+
+CHART_REGIONS_SPEC = {
+    "mark": "area",
+    "encoding": {
+        "x": {"field": "Year", "type": "ordinal", "title": "Año"},
+        "y": {"field": "Ventas", "type": "quantitative", "stack": "zero", "title": "Ventas (millones)"},
+        "color": {"field": "Región", "type": "nominal", "title": "Región"},
+        "tooltip": [
+            {"field": "Year", "type": "ordinal", "title": "Año"},
+            {"field": "Región", "type": "nominal", "title": "Región"},
+            {"field": "Ventas", "type": "quantitative", "title": "Ventas", "format": ",.2f"},
+        ],
+    },
+    "height": 380,
+}
+
 # -------------------------
 # UI - Upload
 # -------------------------
@@ -67,23 +338,19 @@ if not uploaded:
     st.info("⬅️ Sube un CSV desde la barra lateral para empezar.")
     st.stop()
 
-df = load_csv(uploaded)
+file_key = _file_key(uploaded)
 
-missing = ensure_columns(df)
-if missing:
-    st.error(f"Faltan columnas necesarias: {', '.join(sorted(missing))}")
-    st.write("Columnas detectadas:", list(df.columns))
+try:
+    df = clean_csv(uploaded)
+except ValueError as e:
+    st.error(f"Error leyendo el CSV: {e}")
     st.stop()
 
-df = clean_df(df)
-
 if df.empty:
     st.warning("No hay datos válidos tras limpiar (revisa la columna Year / Platform / Global_Sales).")
     st.stop()
 
-min_year, max_year = int(df["Year"].min()), int(df["Year"].max())
-platform_options = sorted(df["Platform"].unique().tolist())
-default_platforms = top_platforms(df, n=min(8, len(platform_options)))
+platform_options, default_platforms, (min_year, max_year) = platform_meta(df, file_key)
 
 with st.sidebar:
     year_range = st.slider(
@@ -104,42 +371,19 @@ with st.sidebar:
     show_raw_table = st.checkbox("Mostrar tabla filtrada", value=False)
 
 # -------------------------
-# Filter
+# Filter + aggregations (cacheados por filtro)
 # -------------------------
 y0, y1 = year_range
-fdf = df[(df["Year"] >= y0) & (df["Year"] <= y1)]
-if selected_platforms:
-    fdf = fdf[fdf["Platform"].isin(selected_platforms)]
-
-if fdf.empty:
-    st.warning("No hay datos para esos filtros (años/plataformas). Prueba a ampliar el rango o seleccionar más plataformas.")
-    st.stop()
+platforms_key = tuple(sorted(selected_platforms))
+tbl = to_arrow(df, file_key)
 
-# -------------------------
-# Aggregations
-# -------------------------
-by_year = (
-    fdf.groupby("Year", as_index=False)["Global_Sales"]
-    .sum()
-    .sort_values("Year")
+n_rows, by_year, by_year_platform, top_plat, by_year_regions_long = compute_aggs(
+    tbl, file_key, y0, y1, platforms_key
 )
 
-by_year_platform = (
-    fdf.groupby(["Year", "Platform"], as_index=False)["Global_Sales"]
-    .sum()
-    .sort_values(["Year", "Platform"])
-)
-
-# Region breakdown (si están las columnas)
-region_cols = [c for c in ["NA_Sales", "EU_Sales", "JP_Sales", "Other_Sales"] if c in fdf.columns]
-by_year_regions = None
-if region_cols:
-    by_year_regions = (
-        fdf.groupby("Year", as_index=False)[region_cols]
-        .sum()
-        .sort_values("Year")
-    )
-    by_year_regions_long = by_year_regions.melt("Year", var_name="Región", value_name="Ventas")
+if n_rows == 0:
+    st.warning("No hay datos para esos filtros (años/plataformas). Prueba a ampliar el rango o seleccionar más plataformas.")
+    st.stop()
 
 # -------------------------
 # KPIs
@@ -147,7 +391,7 @@ if region_cols:
 c1, c2, c3, c4 = st.columns(4)
 c1.metric("Años (rango)", f"{y0}–{y1}")
 c2.metric("Plataformas seleccionadas", str(len(selected_platforms)) if selected_platforms else "Todas")
-c3.metric("Registros (filtrados)", f"{len(fdf):,}".replace(",", "."))
+c3.metric("Registros (filtrados)", f"{n_rows:,}".replace(",", "."))
 c4.metric("Ventas globales (suma)", f"{by_year['Global_Sales'].sum():,.2f}".replace(",", "."))
 
 st.markdown("---")
@@ -159,80 +403,27 @@ left, right = st.columns([1.2, 1])
 
 with left:
     st.subheader("📈 Ventas globales por año (total)")
-    chart_total = (
-        alt.Chart(by_year)
-        .mark_line(point=True)
-        .encode(
-            x=alt.X("Year:O", title="Año"),
-            y=alt.Y("Global_Sales:Q", title="Ventas (millones)"),
-            tooltip=[alt.Tooltip("Year:O", title="Año"), alt.Tooltip("Global_Sales:Q", title="Ventas", format=",.2f")],
-        )
-        .properties(height=320)
-    )
-    st.altair_chart(chart_total, use_container_width=True)
+    st.vega_lite_chart(by_year, CHART_TOTAL_SPEC, use_container_width=True)
 
 with right:
     st.subheader("🎮 Top plataformas (ventas globales)")
-    top_plat = (
-        fdf.groupby("Platform", as_index=False)["Global_Sales"]
-        .sum()
-        .sort_values("Global_Sales", ascending=False)
-        .head(12)
-    )
-    chart_bar = (
-        alt.Chart(top_plat)
-        .mark_bar()
-        .encode(
-            y=alt.Y("Platform:N", sort="-x", title="Plataforma"),
-            x=alt.X("Global_Sales:Q", title="Ventas (millones)"),
-            tooltip=[alt.Tooltip("Platform:N", title="Plataforma"), alt.Tooltip("Global_Sales:Q", title="Ventas", format=",.2f")],
-        )
-        .properties(height=320)
-    )
-    st.altair_chart(chart_bar, use_container_width=True)
+    st.vega_lite_chart(top_plat, CHART_TOP_PLAT_SPEC, use_container_width=True)
 
 st.subheader("🧵 Ventas por año y plataforma (líneas)")
-chart_lines = (
-    alt.Chart(by_year_platform)
-    .mark_line(point=False)
-    .encode(
-        x=alt.X("Year:O", title="Año"),
-        y=alt.Y("Global_Sales:Q", title="Ventas (millones)"),
-        color=alt.Color("Platform:N", title="Plataforma"),
-        tooltip=[
-            alt.Tooltip("Year:O", title="Año"),
-            alt.Tooltip("Platform:N", title="Plataforma"),
-            alt.Tooltip("Global_Sales:Q", title="Ventas", format=",.2f"),
-        ],
-    )
-    .properties(height=380)
-)
-st.altair_chart(chart_lines, use_container_width=True)
+st.vega_lite_chart(by_year_platform, CHART_LINES_SPEC, use_container_width=True)
 
 if show_region_breakdown:
     st.subheader("🗺️ Desglose por regiones (stacked)")
-    if by_year_regions is None:
+    if by_year_regions_long is None:
         st.info("No encuentro columnas de regiones (NA_Sales / EU_Sales / JP_Sales / Other_Sales) en tu fichero.")
     else:
-        chart_regions = (
-            alt.Chart(by_year_regions_long)
-            .mark_area()
-            .encode(
-                x=alt.X("Year:O", title="Año"),
-                y=alt.Y("Ventas:Q", stack="zero", title="Ventas (millones)"),
-                color=alt.Color("Región:N", title="Región"),
-                tooltip=[
-                    alt.Tooltip("Year:O", title="Año"),
-                    alt.Tooltip("Región:N", title="Región"),
-                    alt.Tooltip("Ventas:Q", title="Ventas", format=",.2f"),
-                ],
-            )
-            .properties(height=380)
-        )
-        st.altair_chart(chart_regions, use_container_width=True)
+        st.vega_lite_chart(by_year_regions_long, CHART_REGIONS_SPEC, use_container_width=True)
 
 if show_raw_table:
     st.subheader("🧾 Tabla (filtrada)")
+    fdf = filtered_df(tbl, file_key, y0, y1, platforms_key)
+    if n_rows > len(fdf):
+        st.caption(f"Mostrando las primeras {len(fdf):,} filas de {n_rows:,}".replace(",", "."))
     # Columnas más útiles primero (si existen)
     preferred = ["Name", "Platform", "Year", "Genre", "Publisher", "NA_Sales", "EU_Sales", "JP_Sales", "Other_Sales", "Global_Sales"]
     cols = [c for c in preferred if c in fdf.columns] + [c for c in fdf.columns if c not in preferred]